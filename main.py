@@ -1,153 +1,594 @@
 """
 基于消息总线的生产者-消费者模式
 使用消息总线(Message Bus)实现发布-订阅模式
+
+requires: python3.13t (free-threaded) 可让线程版示例真正并行，普通 CPython 同样可以运行
+线程安全约定（不依赖 GIL）:
+- 发布路径只读取订阅者列表的引用（写时复制），订阅关系的修改都经过 MessageBus._write_lock
+- 环形缓冲区的写游标只在类型锁内推进，已发布消息数由写游标推导
+- 全局发布序号在 MessageBus._seq_lock 内按批分配，不依赖共享迭代器的 next()
+- 消息引用计数在 MessagePool._lock 内增减
+
+运行方式: python main.py 运行线程版示例，python main.py --asyncio 运行协程版示例
 """
+import asyncio
+import sys
 import threading
 import queue
 import time
 import random
-from typing import Dict, List, Callable
-from enum import Enum
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import deque
+from itertools import groupby
+from typing import Dict, List, Callable, Optional
+from enum import IntEnum
+
+# 3.13 之前的解释器没有 sys._is_gil_enabled，GIL 总是启用
+_GIL_ENABLED = getattr(sys, "_is_gil_enabled", lambda: True)()
+
 
+class MessageType(IntEnum):
+    """消息类型枚举，取值即总线内部列表的下标"""
+    ORDER = 0
+    PAYMENT = 1
+    INVENTORY = 2
+    SHIPPING = 3
+    NOTIFICATION = 4
 
-class MessageType(Enum):
-    """消息类型枚举"""
-    ORDER = "订单"
-    PAYMENT = "支付"
-    INVENTORY = "库存"
-    SHIPPING = "物流"
-    NOTIFICATION = "通知"
+    @property
+    def label(self) -> str:
+        """消息类型的中文名称"""
+        return _NAMES[self]
+
+
+# 消息类型的中文名称，按 MessageType 取值索引
+_NAMES = ("订单", "支付", "库存", "物流", "通知")
 
 
 class Message:
     """消息对象"""
 
+    __slots__ = ('msg_type', 'content', 'sender', 'timestamp', 'refs', '_repr')
+
     def __init__(self, msg_type: MessageType, content: str, sender: str):
+        self.reset(msg_type, content, sender)
+
+    def reset(self, msg_type: MessageType, content: str, sender: str):
+        """重新填充消息字段（供对象池复用）"""
         self.msg_type = msg_type
         self.content = content
         self.sender = sender
         self.timestamp = time.time()
+        self.refs = 0  # 尚未归还的订阅者数量
+        # 字段填充后不再修改，展示文本只格式化一次
+        self._repr = f"[{_NAMES[msg_type]}] {sender}: {content}"
 
     def __str__(self):
-        return f"[{self.msg_type.value}] {self.sender}: {self.content}"
+        return self._repr
 
 
-class MessageBus:
+class MessagePool:
     """
-    消息总线 - 核心组件
-    负责消息的路由、分发和管理
+    消息对象池 - 复用 Message 实例，避免每条消息都重新分配对象
+    一条消息会分发给多个订阅者，全部订阅者归还后才放回池中
     """
 
-    def __init__(self, name="主消息总线"):
-        self.name = name
-        # 为每种消息类型维护一个订阅者队列
-        self.subscribers: Dict[MessageType, List[queue.Queue]] = {}
+    def __init__(self, size=1024):
+        self.size = size
+        self._free = deque(Message(MessageType.ORDER, "", "") for _ in range(size))
+        self._lock = threading.Lock()  # 只保护引用计数
+
+    def acquire(self, msg_type: MessageType, content: str, sender: str) -> Message:
+        """取出一条消息并填充字段，池空时新建"""
+        try:
+            message = self._free.pop()
+        except IndexError:
+            return Message(msg_type, content, sender)
+        message.reset(msg_type, content, sender)
+        return message
+
+    def release(self, message: Message):
+        """订阅者处理完消息后归还"""
+        with self._lock:
+            # 引用计数已归零说明归还次数多于计入的读者，不能再回收，否则会改写别人持有的消息
+            if message.refs <= 0:
+                return
+            message.refs -= 1
+            if message.refs > 0:
+                return
+        if len(self._free) < self.size:
+            self._free.append(message)
+
+
+class RingBuffer:
+    """
+    单类型消息环形缓冲区
+    发布者只写入一次槽位，每个订阅者各自推进读游标（单生产者多消费者）
+    """
+
+    def __init__(self, capacity=1024):
+        # 容量取不小于 capacity 的 2 的幂，下标用位与代替取模
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.mask = size - 1
+        # 槽位戳: 写入第 seq 条消息时先置为 seq*2+1，写完后置为 seq*2+2
+        self.stamps = array('Q', [0]) * size
+        self.slots: List[Optional[Message]] = [None] * size
+        # 每个槽位消息的全局发布序号，多类型订阅者据此按发布顺序读取
+        self.orders = array('Q', [0]) * size
+        self.cursor = 0  # 下一条待写入消息的序号
+        # 同一类型可能有多个生产者，用本类型自己的小锁串行化写入
         self.lock = threading.Lock()
-        self.message_count = 0
 
-        # 初始化所有消息类型的订阅者列表
-        for msg_type in MessageType:
-            self.subscribers[msg_type] = []
+    def write(self, message: Message, order: int) -> int:
+        """写入一条全局序号为 order 的消息，返回其环内序号（调用方需持有 self.lock）"""
+        seq = self.cursor
+        i = seq & self.mask
+        self.stamps[i] = seq * 2 + 1
+        self.slots[i] = message
+        self.orders[i] = order
+        self.stamps[i] = seq * 2 + 2
+        self.cursor = seq + 1
+        return seq
+
+
+class RingSubscriber:
+    """环形缓冲区的订阅者句柄 - 持有独立的读游标"""
+
+    def __init__(self, ring: RingBuffer, inbox: "Inbox"):
+        self.ring = ring
+        self.inbox = inbox  # 有新消息时需要唤醒的收件箱
+        self.read_seq = ring.cursor  # 只接收订阅之后发布的消息
+        self.dropped = 0  # 落后超过缓冲区容量而被覆盖、未能读到的消息数
+        # 取消订阅时的写游标: 之后发布的消息不计入本句柄的引用，不能再读取
+        self.end_seq: Optional[int] = None
+
+    def _readable_end(self) -> int:
+        # 先读写游标再读 end_seq: 能看到取消订阅之后写入的消息时，也一定能看到 end_seq
+        end = self.ring.cursor
+        if self.end_seq is not None:
+            end = min(end, self.end_seq)
+        return end
+
+    def peek_order(self) -> Optional[int]:
+        """下一条可读消息的全局发布序号，没有新消息时返回 None；槽位已被覆盖时返回 0，交给 try_recv 处理"""
+        ring = self.ring
+        seq = self.read_seq
+        if seq >= self._readable_end():
+            return None
+        i = seq & ring.mask
+        stamp = ring.stamps[i]
+        order = ring.orders[i]
+        if ring.stamps[i] == stamp == seq * 2 + 2:
+            return order
+        return 0
+
+    def try_recv(self) -> Optional[Message]:
+        """非阻塞读取下一条消息，没有新消息时返回 None"""
+        ring = self.ring
+        while True:
+            seq = self.read_seq
+            if seq >= self._readable_end():
+                return None
+
+            i = seq & ring.mask
+            stamp = ring.stamps[i]
+            message = ring.slots[i]
+            if ring.stamps[i] == stamp == seq * 2 + 2:
+                self.read_seq = seq + 1
+                return message
+
+            # 槽位已被下一圈覆盖（落后超过容量），丢弃过期消息，追到最早的有效位置
+            # 被丢弃的消息不会再归还对象池，由池按需新建补充
+            self.read_seq = max(seq + 1, ring.cursor - len(ring.slots))
+            skipped = self.read_seq - seq
+            self.dropped += skipped
+            print(f"   ⚠️  订阅者落后超过缓冲区容量，丢弃 {skipped} 条消息")
+
+
+class _Bucket:
+    """
+    单个消息类型在总线上的全部状态
+    只负责归组；CPython 无法控制对象的内存布局，也无法按缓存行填充对象
+    """
 
-    def subscribe(self, msg_type: MessageType, subscriber_queue: queue.Queue):
-        """订阅某类消息"""
-        with self.lock:
-            if subscriber_queue not in self.subscribers[msg_type]:
-                self.subscribers[msg_type].append(subscriber_queue)
-                print(f"📡 [{self.name}] 新订阅者注册: {msg_type.value}")
+    __slots__ = ('ring', 'subs', 'owners', 'count')
+
+    def __init__(self, capacity: int):
+        self.ring = RingBuffer(capacity)
+        self.subs: List[RingSubscriber] = []  # 写时复制，修改时整体替换
+        # id(收件箱) → 订阅者句柄，订阅关系的查重和删除不再线性扫描
+        self.owners: Dict[int, RingSubscriber] = {}
+        self.count = 0  # 订阅者数量，在类型锁内随订阅关系一起更新
+
+
+class Pipe:
+    """
+    流水线阶段之间的直连管道（单生产者单消费者）
+    上一阶段的输出直接交给下一阶段，不经过总线的分发
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # C 实现的无界队列，单锁且没有 maxsize/task_done 的额外开销
+        self._q = queue.SimpleQueue()
+
+    def send(self, message: Message):
+        """发送消息给下一阶段"""
+        message.refs = 1  # 只有下一阶段一个读者
+        self._q.put(message)
+
+    def get(self, timeout: float) -> Message:
+        """获取下一条消息，超时抛出 queue.Empty"""
+        return self._q.get(timeout=timeout)
+
+
+class _LogThread(threading.Thread):
+    """后台日志线程 - 发布路径只把日志条目入队，输出在这里完成"""
+
+    def __init__(self, bus_name: str):
+        super().__init__(daemon=True)
+        self.bus_name = bus_name
+        self.log_q = queue.SimpleQueue()
+
+    def run(self):
+        while True:
+            entry = self.log_q.get()
+            if entry is None:
+                break
+            seq, text, subscriber_count = entry
+            print(f"📤 [{self.bus_name}] 发布消息 #{seq}: {text}")
+            print(f"   → 将分发给 {subscriber_count} 个订阅者")
+
+
+class MessageBus:
+    """
+    消息总线 - 核心组件
+    负责消息的路由、分发和管理
+    每种消息类型对应一个环形缓冲区，发布只写一次，订阅者各自读取
+    """
 
-    def unsubscribe(self, msg_type: MessageType, subscriber_queue: queue.Queue):
+    def __init__(self, name="主消息总线", capacity=1024):
+        self.name = name
+        # 按消息类型序号索引，每种类型的环形缓冲区和订阅者列表放在各自的桶里
+        # 订阅者列表写时复制: 修改时整体替换，发布时直接读取引用，无需加锁
+        self._buckets: List[_Bucket] = [_Bucket(capacity) for _ in MessageType]
+        self._write_lock = threading.Lock()  # 只串行化订阅关系的修改
+        # 全局发布序号，每批消息在类型锁内加锁分配一次
+        self._next_seq = 1
+        self._seq_lock = threading.Lock()
+        self.pool = MessagePool()
+        self._logger = _LogThread(name)
+        self._logger.start()
+
+    @property
+    def message_count(self):
+        """已发布的消息总数（各类型缓冲区写游标之和）"""
+        return sum(bucket.ring.cursor for bucket in self._buckets)
+
+    @property
+    def dropped_count(self):
+        """订阅者因落后超过缓冲区容量而丢弃的消息总数"""
+        return sum(sub.dropped for bucket in self._buckets for sub in bucket.subs)
+
+    def subscribe(self, msg_type: MessageType, inbox: "Inbox") -> RingSubscriber:
+        """订阅某类消息，返回订阅者句柄；同一收件箱重复订阅返回已有句柄"""
+        bucket = self._buckets[msg_type]
+        with self._write_lock:
+            subscriber = bucket.owners.get(id(inbox))
+            if subscriber is not None:
+                return subscriber
+            # 持有类型锁注册，保证每条消息的引用计数与能读到它的订阅者一致
+            with bucket.ring.lock:
+                subscriber = RingSubscriber(bucket.ring, inbox)
+                bucket.owners[id(inbox)] = subscriber
+                bucket.subs = bucket.subs + [subscriber]
+                bucket.count += 1
+            print(f"📡 [{self.name}] 新订阅者注册: {msg_type.label}")
+        return subscriber
+
+    def unsubscribe(self, msg_type: MessageType, subscriber: RingSubscriber):
         """取消订阅"""
-        with self.lock:
-            if subscriber_queue in self.subscribers[msg_type]:
-                self.subscribers[msg_type].remove(subscriber_queue)
+        bucket = self._buckets[msg_type]
+        with self._write_lock:
+            if bucket.owners.get(id(subscriber.inbox)) is subscriber:
+                with bucket.ring.lock:
+                    del bucket.owners[id(subscriber.inbox)]
+                    bucket.subs = list(bucket.owners.values())
+                    bucket.count -= 1
+                    # 句柄只能读完取消订阅前发布的消息（它们的引用计数包含该句柄）
+                    subscriber.end_seq = bucket.ring.cursor
 
     def publish(self, message: Message):
         """发布消息到总线"""
-        with self.lock:
-            self.message_count += 1
-            subscribers = self.subscribers.get(message.msg_type, [])
-
-            print(f"📤 [{self.name}] 发布消息 #{self.message_count}: {message}")
-            print(f"   → 将分发给 {len(subscribers)} 个订阅者")
-
-            # 将消息分发给所有订阅者
-            for sub_queue in subscribers:
-                sub_queue.put(message)
+        self.publish_many((message,))
+
+    def publish_many(self, messages: List[Message]):
+        """批量发布消息，连续的同类型消息只获取一次类型锁、只唤醒一次订阅者"""
+        for msg_type, group in groupby(messages, key=lambda m: m.msg_type):
+            batch = list(group)
+            # 消息写入后可能被订阅者处理完并回收复用，先取出日志文本
+            texts = [str(message) for message in batch]
+
+            # 写入该类型的环形缓冲区即完成分发，订阅者自行读取
+            bucket = self._buckets[msg_type]
+            ring = bucket.ring
+            with ring.lock:
+                # 取订阅者列表快照，之后的订阅变化不会影响本次遍历
+                subscribers = bucket.subs
+                refs = bucket.count
+                with self._seq_lock:
+                    first_seq = self._next_seq
+                    self._next_seq += len(batch)
+                for seq, message in enumerate(batch, first_seq):
+                    message.refs = refs
+                    ring.write(message, seq)
+
+            log_q = self._logger.log_q
+            for seq, text in enumerate(texts, first_seq):
+                # 记录类型锁内确定的分发数量，而不是输出时的最新订阅者数
+                log_q.put((seq, text, refs))
+
+            # 只唤醒正在等待的订阅者
+            for subscriber in subscribers:
+                subscriber.inbox.notify()
+
+    def make_pipe(self, msg_type: MessageType) -> Pipe:
+        """为流水线的相邻两个阶段建立直连管道，传递 msg_type 类型的消息"""
+        print(f"🔗 [{self.name}] 建立直连管道: {msg_type.label}")
+        return Pipe(f"{self.name}-{msg_type.label}")
+
+    def close(self):
+        """停止后台日志线程，等待已入队的日志输出完毕"""
+        if self._logger.is_alive():
+            self._logger.log_q.put(None)
+            self._logger.join()
 
     def get_stats(self):
         """获取总线统计信息"""
-        with self.lock:
+        with self._write_lock:
             stats = {}
-            for msg_type, subs in self.subscribers.items():
-                stats[msg_type.value] = len(subs)
+            for msg_type, bucket in zip(MessageType, self._buckets):
+                stats[msg_type.label] = bucket.count
             return stats
 
 
-class Producer(threading.Thread):
-    """生产者 - 向消息总线发布消息"""
+class Inbox:
+    """消费者收件箱 - 聚合多个消息类型的订阅者句柄"""
 
-    def __init__(self, name: str, bus: MessageBus, msg_type: MessageType, count=5):
-        super().__init__()
+    def __init__(self, bus: MessageBus, msg_types: List[MessageType]):
+        self.bus = bus
+        self._cv = threading.Condition()
+        self._waiting = False
+        self.msg_types = list(msg_types)
+        self.subscriptions = [bus.subscribe(msg_type, self) for msg_type in msg_types]
+
+    def close(self):
+        """取消全部订阅并移除句柄，之后发布的消息不再投递到本收件箱"""
+        for msg_type, subscription in zip(self.msg_types, self.subscriptions):
+            self.bus.unsubscribe(msg_type, subscription)
+        self.msg_types = []
+        self.subscriptions = []
+
+    def notify(self):
+        """发布者写入新消息后调用，只在消费者挂起等待时才获取锁唤醒"""
+        # 没有 GIL 时等待标志的读写顺序没有保证，总是加锁唤醒
+        if self._waiting or not _GIL_ENABLED:
+            with self._cv:
+                self._cv.notify()
+
+    def _poll(self) -> Optional[Message]:
+        # 在所有订阅的类型中取发布最早的一条，保持与单个 FIFO 队列相同的到达顺序
+        oldest, oldest_order = None, None
+        for subscription in self.subscriptions:
+            order = subscription.peek_order()
+            if order is not None and (oldest is None or order < oldest_order):
+                oldest, oldest_order = subscription, order
+        if oldest is None:
+            return None
+        return oldest.try_recv()
+
+    def get(self, timeout: float) -> Message:
+        """获取下一条消息，超时抛出 queue.Empty"""
+        message = self._poll()
+        if message is not None:
+            return message
+
+        with self._cv:
+            # 先置等待标志再检查缓冲区，发布者先写缓冲区再读标志，二者至少有一方能看到对方
+            self._waiting = True
+            message = self._cv.wait_for(self._poll, timeout)
+            self._waiting = False
+
+        if message is None:
+            raise queue.Empty
+        return message
+
+
+class Producer:
+    """生产者 - 向消息总线发布消息，run() 提交到线程池执行"""
+
+    def __init__(self, name: str, bus: MessageBus, msg_type: MessageType, count=5, batch_size=1):
         self.name = name
         self.bus = bus
         self.msg_type = msg_type
         self.count = count
+        # 预先生成每次的模拟耗时，循环中不再调用随机数生成器
+        self._sleeps = [random.uniform(0.2, 0.8) for _ in range(count)]
+        self.batch_size = batch_size  # 攒够多少条消息发布一次
 
     def run(self):
         """生产并发布消息"""
-        print(f"🏭 [生产者-{self.name}] 启动，准备生产 {self.count} 条 {self.msg_type.value} 消息")
+        print(f"🏭 [生产者-{self.name}] 启动，准备生产 {self.count} 条 {self.msg_type.label} 消息")
 
+        batch = []
         for i in range(self.count):
             # 模拟生产耗时
-            time.sleep(random.uniform(0.2, 0.8))
+            time.sleep(self._sleeps[i])
 
             # 创建消息
-            content = f"{self.msg_type.value}数据-{i + 1}"
-            message = Message(self.msg_type, content, self.name)
+            content = f"{self.msg_type.label}数据-{i + 1}"
+            batch.append(self.bus.pool.acquire(self.msg_type, content, self.name))
 
-            # 发布到总线
-            self.bus.publish(message)
+            # 攒够一批后发布到总线
+            if len(batch) >= self.batch_size:
+                self.bus.publish_many(batch)
+                batch = []
+
+        # 发布剩余不足一批的消息
+        if batch:
+            self.bus.publish_many(batch)
 
         print(f"✅ [生产者-{self.name}] 完成生产")
 
 
-class Consumer(threading.Thread):
-    """消费者 - 从消息总线订阅并消费消息"""
+class Consumer:
+    """消费者 - 从消息总线订阅并消费消息，run() 提交到线程池执行"""
 
     def __init__(self, name: str, bus: MessageBus, interested_types: List[MessageType], count=5):
-        super().__init__()
         self.name = name
         self.bus = bus
         self.interested_types = interested_types
         self.count = count
-        self.message_queue = queue.Queue(maxsize=20)
-        self.daemon = True  # 设置为守护线程
+        self._sleeps = [random.uniform(0.3, 1.0) for _ in range(count)]
+        self._stopped = threading.Event()
 
         # 订阅感兴趣的消息类型
-        for msg_type in interested_types:
-            bus.subscribe(msg_type, self.message_queue)
+        self.message_queue = Inbox(bus, interested_types)
+
+    def stop(self):
+        """通知消费者在下一次等待超时后退出"""
+        self._stopped.set()
 
     def run(self):
         """消费消息"""
-        types_str = ", ".join([t.value for t in self.interested_types])
+        types_str = ", ".join([t.label for t in self.interested_types])
         print(f"🛒 [消费者-{self.name}] 启动，订阅: {types_str}")
 
         consumed = 0
-        while consumed < self.count:
+        while consumed < self.count and not self._stopped.is_set():
             try:
                 # 从队列获取消息
                 message = self.message_queue.get(timeout=2)
 
                 # 模拟处理耗时
-                time.sleep(random.uniform(0.3, 1.0))
+                time.sleep(self._sleeps[consumed])
 
                 print(f"   ✓ [消费者-{self.name}] 处理: {message}")
                 consumed += 1
+                self.bus.pool.release(message)
 
             except queue.Empty:
                 print(f"   ⏳ [消费者-{self.name}] 等待消息...")
 
+        if consumed < self.count:
+            print(f"⏹️  [消费者-{self.name}] 已停止，处理了 {consumed}/{self.count} 条")
+        else:
+            print(f"✅ [消费者-{self.name}] 完成消费")
+
+
+class AsyncMessageBus:
+    """
+    协程版消息总线
+    所有参与者运行在同一个事件循环中，订阅者使用 asyncio.Queue，无需加锁
+    """
+
+    def __init__(self, name="协程消息总线"):
+        self.name = name
+        self._subs: List[List[asyncio.Queue]] = [[] for _ in MessageType]
+        self._subs_set: List[set] = [set() for _ in MessageType]  # 订阅队列的 id，用于查重
+        self.message_count = 0
+
+    def subscribe(self, msg_type: MessageType, subscriber_queue: asyncio.Queue):
+        """订阅某类消息"""
+        members = self._subs_set[msg_type]
+        if id(subscriber_queue) not in members:
+            members.add(id(subscriber_queue))
+            self._subs[msg_type].append(subscriber_queue)
+            print(f"📡 [{self.name}] 新订阅者注册: {msg_type.label}")
+
+    def unsubscribe(self, msg_type: MessageType, subscriber_queue: asyncio.Queue):
+        """取消订阅"""
+        members = self._subs_set[msg_type]
+        if id(subscriber_queue) in members:
+            members.discard(id(subscriber_queue))
+            self._subs[msg_type].remove(subscriber_queue)
+
+    async def publish(self, message: Message):
+        """发布消息到总线"""
+        self.message_count += 1
+        subscribers = self._subs[message.msg_type]
+
+        print(f"📤 [{self.name}] 发布消息 #{self.message_count}: {message}")
+        print(f"   → 将分发给 {len(subscribers)} 个订阅者")
+
+        for sub_queue in subscribers:
+            await sub_queue.put(message)
+
+    def get_stats(self):
+        """获取总线统计信息"""
+        return {msg_type.label: len(subs) for msg_type, subs in zip(MessageType, self._subs)}
+
+
+class AsyncProducer:
+    """协程版生产者"""
+
+    def __init__(self, name: str, bus: AsyncMessageBus, msg_type: MessageType, count=5):
+        self.name = name
+        self.bus = bus
+        self.msg_type = msg_type
+        self.count = count
+        self._sleeps = [random.uniform(0.2, 0.8) for _ in range(count)]
+
+    async def run(self):
+        """生产并发布消息"""
+        print(f"🏭 [生产者-{self.name}] 启动，准备生产 {self.count} 条 {self.msg_type.label} 消息")
+
+        for i in range(self.count):
+            # 模拟生产耗时，让出事件循环而不是阻塞线程
+            await asyncio.sleep(self._sleeps[i])
+
+            content = f"{self.msg_type.label}数据-{i + 1}"
+            await self.bus.publish(Message(self.msg_type, content, self.name))
+
+        print(f"✅ [生产者-{self.name}] 完成生产")
+
+
+class AsyncConsumer:
+    """协程版消费者"""
+
+    def __init__(self, name: str, bus: AsyncMessageBus, interested_types: List[MessageType], count=5):
+        self.name = name
+        self.bus = bus
+        self.interested_types = interested_types
+        self.count = count
+        self._sleeps = [random.uniform(0.3, 1.0) for _ in range(count)]
+        self.message_queue: asyncio.Queue = asyncio.Queue(maxsize=20)
+
+        for msg_type in interested_types:
+            bus.subscribe(msg_type, self.message_queue)
+
+    async def run(self):
+        """消费消息"""
+        types_str = ", ".join([t.label for t in self.interested_types])
+        print(f"🛒 [消费者-{self.name}] 启动，订阅: {types_str}")
+
+        consumed = 0
+        while consumed < self.count:
+            try:
+                message = await asyncio.wait_for(self.message_queue.get(), timeout=2)
+
+                # 模拟处理耗时
+                await asyncio.sleep(self._sleeps[consumed])
+
+                print(f"   ✓ [消费者-{self.name}] 处理: {message}")
+                consumed += 1
+
+            except asyncio.TimeoutError:
+                print(f"   ⏳ [消费者-{self.name}] 等待消息...")
+
         print(f"✅ [消费者-{self.name}] 完成消费")
 
 
@@ -172,19 +613,29 @@ def demo_simple():
         Consumer("订单处理器2", bus, [MessageType.ORDER], count=3),
     ]
 
-    # 启动所有线程
-    for p in producers:
-        p.start()
-    for c in consumers:
-        c.start()
+    # 在线程池中运行所有参与者
+    try:
+        with ThreadPoolExecutor(max_workers=len(producers) + len(consumers)) as executor:
+            producer_futures = [executor.submit(p.run) for p in producers]
+            consumer_futures = [executor.submit(c.run) for c in consumers]
 
-    # 等待生产者完成
-    for p in producers:
-        p.join()
-
-    # 等待消费者完成
-    for c in consumers:
-        c.join(timeout=5)
+            # 生产者抛出异常时也要通知消费者退出，否则线程池退出时会一直等待
+            try:
+                # 等待生产者完成
+                for f in producer_futures:
+                    f.result()
+
+                # 等待消费者完成，超时后通知其退出
+                wait(consumer_futures, timeout=5)
+            finally:
+                for c in consumers:
+                    c.stop()
+
+        # 线程池退出时不会重新抛出任务中的异常，逐个取结果让消费者的错误暴露出来
+        for f in consumer_futures:
+            f.result()
+    finally:
+        bus.close()
 
     print(f"\n📊 总线统计: {bus.get_stats()}")
 
@@ -200,7 +651,7 @@ def demo_complex():
 
     # 创建多类型生产者
     producers = [
-        Producer("订单系统", bus, MessageType.ORDER, count=4),
+        Producer("订单系统", bus, MessageType.ORDER, count=4, batch_size=2),
         Producer("支付系统", bus, MessageType.PAYMENT, count=4),
         Producer("仓储系统", bus, MessageType.INVENTORY, count=3),
         Producer("物流系统", bus, MessageType.SHIPPING, count=3),
@@ -222,25 +673,34 @@ def demo_complex():
                                    MessageType.INVENTORY, MessageType.SHIPPING], count=8),
     ]
 
-    # 启动所有线程
-    for p in producers:
-        p.start()
+    # 在线程池中运行所有参与者
+    try:
+        with ThreadPoolExecutor(max_workers=len(producers) + len(consumers)) as executor:
+            producer_futures = [executor.submit(p.run) for p in producers]
 
-    time.sleep(0.5)  # 稍微延迟启动消费者
+            time.sleep(0.5)  # 稍微延迟启动消费者
 
-    for c in consumers:
-        c.start()
+            consumer_futures = [executor.submit(c.run) for c in consumers]
 
-    # 等待生产者完成
-    for p in producers:
-        p.join()
+            try:
+                # 等待生产者完成
+                for f in producer_futures:
+                    f.result()
+
+                # 等待消费者完成，超时后通知其退出
+                wait(consumer_futures, timeout=10)
+            finally:
+                for c in consumers:
+                    c.stop()
 
-    # 等待消费者完成
-    for c in consumers:
-        c.join(timeout=10)
+        for f in consumer_futures:
+            f.result()
+    finally:
+        bus.close()
 
     print(f"\n📊 总线统计: {bus.get_stats()}")
     print(f"📈 总共处理消息数: {bus.message_count}")
+    print(f"📉 丢弃消息数: {bus.dropped_count}")
 
 
 def demo_pipeline():
@@ -251,35 +711,41 @@ def demo_pipeline():
 
     bus = MessageBus("流水线总线")
 
-    class ProcessingConsumer(threading.Thread):
-        """处理后转发的消费者"""
+    class ProcessingConsumer:
+        """处理后转发的消费者，可以通过直连管道与相邻阶段相连"""
 
         def __init__(self, name: str, bus: MessageBus,
-                     input_type: MessageType, output_type: MessageType, count=3):
-            super().__init__()
+                     input_type: MessageType, output_type: MessageType, count=3,
+                     in_pipe: Optional[Pipe] = None, out_pipe: Optional[Pipe] = None):
             self.name = name
             self.bus = bus
             self.input_type = input_type
             self.output_type = output_type
             self.count = count
-            self.message_queue = queue.Queue()
-            bus.subscribe(input_type, self.message_queue)
+            self._sleeps = [random.uniform(0.2, 0.5) for _ in range(count)]
+            # 没有上游管道时从总线订阅输入
+            self.message_queue = in_pipe if in_pipe is not None else Inbox(bus, [input_type])
+            self.out_pipe = out_pipe
 
         def run(self):
-            print(f"⚙️  [处理器-{self.name}] 启动: {self.input_type.value} → {self.output_type.value}")
+            print(f"⚙️  [处理器-{self.name}] 启动: {self.input_type.label} → {self.output_type.label}")
 
             processed = 0
             while processed < self.count:
                 try:
                     message = self.message_queue.get(timeout=3)
-                    time.sleep(random.uniform(0.2, 0.5))
+                    time.sleep(self._sleeps[processed])
 
                     print(f"   ⚙️  [处理器-{self.name}] 处理: {message.content}")
 
                     # 处理完后发布新消息
                     new_content = f"已处理-{message.content}"
-                    new_message = Message(self.output_type, new_content, self.name)
-                    self.bus.publish(new_message)
+                    self.bus.pool.release(message)
+                    new_message = self.bus.pool.acquire(self.output_type, new_content, self.name)
+                    if self.out_pipe is not None:
+                        self.out_pipe.send(new_message)
+                    else:
+                        self.bus.publish(new_message)
 
                     processed += 1
                 except queue.Empty:
@@ -288,37 +754,100 @@ def demo_pipeline():
             print(f"✅ [处理器-{self.name}] 完成")
 
     # 创建流水线: ORDER → PAYMENT → SHIPPING
+    # 只有首尾经过总线，中间的支付消息通过直连管道传递
     producer = Producer("初始订单", bus, MessageType.ORDER, count=3)
 
-    processor1 = ProcessingConsumer("支付处理", bus, MessageType.ORDER, MessageType.PAYMENT, count=3)
-    processor2 = ProcessingConsumer("发货处理", bus, MessageType.PAYMENT, MessageType.SHIPPING, count=3)
+    payment_pipe = bus.make_pipe(MessageType.PAYMENT)
+    processor1 = ProcessingConsumer("支付处理", bus, MessageType.ORDER, MessageType.PAYMENT, count=3,
+                                    out_pipe=payment_pipe)
+    processor2 = ProcessingConsumer("发货处理", bus, MessageType.PAYMENT, MessageType.SHIPPING, count=3,
+                                    in_pipe=payment_pipe)
 
     final_consumer = Consumer("最终处理", bus, [MessageType.SHIPPING], count=3)
 
     # 启动
-    processor1.start()
-    processor2.start()
-    final_consumer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            processor_futures = [executor.submit(p.run) for p in (processor1, processor2)]
+            final_future = executor.submit(final_consumer.run)
+
+            time.sleep(0.5)
+            producer_future = executor.submit(producer.run)
+
+            try:
+                producer_future.result()
+                for f in processor_futures:
+                    f.result()
 
-    time.sleep(0.5)
-    producer.start()
+                wait([final_future], timeout=5)
+            finally:
+                final_consumer.stop()
 
-    producer.join()
-    processor1.join()
-    processor2.join()
-    final_consumer.join(timeout=5)
+        final_future.result()
+    finally:
+        bus.close()
 
     print(f"\n📊 总线统计: {bus.get_stats()}")
 
 
+def demo_async():
+    """示例4: 协程版电商系统（单线程事件循环）"""
+    print("\n" + "=" * 80)
+    print("示例4: 协程场景 - asyncio 驱动的电商消息流转")
+    print("=" * 80 + "\n")
+
+    async def main():
+        bus = AsyncMessageBus("协程电商总线")
+
+        producers = [
+            AsyncProducer("订单系统", bus, MessageType.ORDER, count=4),
+            AsyncProducer("支付系统", bus, MessageType.PAYMENT, count=4),
+            AsyncProducer("仓储系统", bus, MessageType.INVENTORY, count=3),
+            AsyncProducer("物流系统", bus, MessageType.SHIPPING, count=3),
+        ]
+
+        consumers = [
+            AsyncConsumer("订单处理器", bus, [MessageType.ORDER, MessageType.PAYMENT], count=4),
+            AsyncConsumer("库存管理器", bus, [MessageType.ORDER, MessageType.INVENTORY], count=4),
+            AsyncConsumer("物流协调器", bus, [MessageType.PAYMENT, MessageType.SHIPPING], count=4),
+            AsyncConsumer("通知服务", bus, [MessageType.ORDER, MessageType.PAYMENT,
+                                            MessageType.INVENTORY, MessageType.SHIPPING], count=8),
+        ]
+
+        producer_tasks = [asyncio.create_task(p.run()) for p in producers]
+
+        await asyncio.sleep(0.5)  # 稍微延迟启动消费者
+
+        consumer_tasks = [asyncio.create_task(c.run()) for c in consumers]
+
+        # 等待生产者完成
+        await asyncio.gather(*producer_tasks)
+
+        # 等待消费者完成，超时后取消
+        try:
+            await asyncio.wait_for(asyncio.gather(*consumer_tasks), timeout=10)
+        except asyncio.TimeoutError:
+            pass
+
+        print(f"\n📊 总线统计: {bus.get_stats()}")
+        print(f"📈 总共处理消息数: {bus.message_count}")
+
+    asyncio.run(main())
+
+
 if __name__ == "__main__":
-    demo_simple()
-    time.sleep(1)
+    if "--asyncio" in sys.argv[1:]:
+        demo_async()
+    else:
+        print(f"🧵 线程版示例，GIL: {'启用' if _GIL_ENABLED else '关闭（自由线程）'}")
+
+        demo_simple()
+        time.sleep(1)
 
-    demo_complex()
-    time.sleep(1)
+        demo_complex()
+        time.sleep(1)
 
-    demo_pipeline()
+        demo_pipeline()
 
     print("\n" + "=" * 80)
     print("所有示例运行完成！")
@@ -0,0 +1,127 @@
+"""
+消息总线的回归测试
+运行: python -m unittest discover -s tests
+"""
+import contextlib
+import io
+import queue
+import unittest
+
+from main import Inbox, MessageBus, MessageType
+
+
+class MessageBusTestCase(unittest.TestCase):
+    """每个用例一条独立的总线，屏蔽总线和后台日志线程的输出"""
+
+    def setUp(self):
+        self._stdout = contextlib.redirect_stdout(io.StringIO())
+        self._stdout.__enter__()
+        self.bus = MessageBus("测试总线")
+
+    def tearDown(self):
+        self.bus.close()
+        self._stdout.__exit__(None, None, None)
+
+    def publish(self, msg_type: MessageType, content: str):
+        message = self.bus.pool.acquire(msg_type, content, "测试")
+        self.bus.publish(message)
+        return message
+
+
+class UnsubscribeTest(MessageBusTestCase):
+
+    def test_unsubscribed_inbox_stops_receiving(self):
+        inbox_a = Inbox(self.bus, [MessageType.ORDER])
+        inbox_b = Inbox(self.bus, [MessageType.ORDER])
+
+        inbox_a.close()
+        self.assertEqual(inbox_a.subscriptions, [])
+
+        message = self.publish(MessageType.ORDER, "x")
+        self.assertEqual(message.refs, 1)
+
+        with self.assertRaises(queue.Empty):
+            inbox_a.get(timeout=0.05)
+        self.assertIs(inbox_b.get(timeout=0.05), message)
+
+    def test_detached_handle_cannot_read_later_messages(self):
+        inbox_a = Inbox(self.bus, [MessageType.ORDER])
+        inbox_b = Inbox(self.bus, [MessageType.ORDER])
+        handle_a = inbox_a.subscriptions[0]
+
+        self.bus.unsubscribe(MessageType.ORDER, handle_a)
+        self.publish(MessageType.ORDER, "x")
+        self.assertIsNone(handle_a.try_recv())
+
+        # B 归还后消息被复用为支付消息，B 的订单订阅不应受影响
+        message = inbox_b.get(timeout=0.05)
+        self.bus.pool.release(message)
+        reused = self.bus.pool.acquire(MessageType.PAYMENT, "y", "测试")
+        self.assertIs(reused, message)
+        with self.assertRaises(queue.Empty):
+            inbox_b.get(timeout=0.05)
+
+    def test_messages_published_before_unsubscribe_stay_readable(self):
+        inbox = Inbox(self.bus, [MessageType.ORDER])
+        message = self.publish(MessageType.ORDER, "x")
+
+        self.bus.unsubscribe(MessageType.ORDER, inbox.subscriptions[0])
+
+        self.assertIs(inbox.get(timeout=0.05), message)
+        with self.assertRaises(queue.Empty):
+            inbox.get(timeout=0.05)
+
+
+class InboxOrderTest(MessageBusTestCase):
+
+    def test_multi_type_inbox_reads_in_publish_order(self):
+        inbox = Inbox(self.bus, [MessageType.PAYMENT, MessageType.SHIPPING])
+        published = [
+            self.publish(MessageType.SHIPPING, "物流-1"),
+            self.publish(MessageType.PAYMENT, "支付-1"),
+            self.publish(MessageType.PAYMENT, "支付-2"),
+            self.publish(MessageType.SHIPPING, "物流-2"),
+        ]
+
+        received = [inbox.get(timeout=0.05) for _ in published]
+        self.assertEqual(received, published)
+
+    def test_batch_keeps_publish_order(self):
+        inbox = Inbox(self.bus, [MessageType.ORDER, MessageType.PAYMENT])
+        pool = self.bus.pool
+        payment = self.publish(MessageType.PAYMENT, "支付-1")
+        batch = [pool.acquire(MessageType.ORDER, f"订单-{i}", "测试") for i in range(3)]
+        self.bus.publish_many(batch)
+
+        received = [inbox.get(timeout=0.05) for _ in range(4)]
+        self.assertEqual(received, [payment] + batch)
+
+
+class MessagePoolTest(MessageBusTestCase):
+
+    def test_message_recycled_after_last_release(self):
+        Inbox(self.bus, [MessageType.ORDER])
+        Inbox(self.bus, [MessageType.ORDER])
+        pool = self.bus.pool
+        message = self.publish(MessageType.ORDER, "x")
+        free = len(pool._free)
+
+        pool.release(message)
+        self.assertEqual(len(pool._free), free)
+        pool.release(message)
+        self.assertEqual(len(pool._free), free + 1)
+
+    def test_extra_release_does_not_recycle_again(self):
+        Inbox(self.bus, [MessageType.ORDER])
+        pool = self.bus.pool
+        message = self.publish(MessageType.ORDER, "x")
+
+        pool.release(message)
+        free = len(pool._free)
+        pool.release(message)
+        self.assertEqual(len(pool._free), free)
+        self.assertEqual(message.refs, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()